@@ -0,0 +1,150 @@
+# ============================================================
+# Cross-request Patch Batching
+# ============================================================
+
+import asyncio
+from collections import deque
+from concurrent.futures import Executor
+from typing import Deque, List, Optional
+
+import torch
+from py_real_esrgan.model import RealESRGAN
+
+from app.inference import (
+    BATCH_SIZE,
+    extract_patches,
+    forward_patches,
+    offload_tiles,
+    stitch_patches,
+    wait_for_offload,
+)
+
+# ============================================================
+# Batching Configuration
+# ============================================================
+
+BATCH_WINDOW_SECONDS = 0.01   # How long a partial batch waits for more patches
+BATCH_POLL_SECONDS = 0.002    # Queue re-check interval inside the window
+
+
+@torch.inference_mode()
+def _forward_batch(model: RealESRGAN, slices: List[torch.Tensor], scale: int) -> torch.Tensor:
+    """Join patch slices from several requests, run them as one batch and start the host copy"""
+    patches = slices[0] if len(slices) == 1 else torch.cat(slices)
+    return offload_tiles(forward_patches(model, patches, scale))
+
+
+@torch.inference_mode()
+def _stitch_tiles(tiles: List[torch.Tensor], rows: int, cols: int, height: int, width: int, scale: int) -> torch.Tensor:
+    """Join a request's tiles from every batch it was part of and reassemble the image"""
+    wait_for_offload()
+    return stitch_patches(torch.cat(tiles), rows, cols, height, width, scale)
+
+
+class _PatchJob:
+    """One request's patches, how many have been sent, and the tiles returned so far"""
+
+    __slots__ = ("patches", "taken", "tiles", "future")
+
+    def __init__(self, patches: torch.Tensor, future: asyncio.Future):
+        self.patches = patches
+        self.taken = 0
+        self.tiles: List[torch.Tensor] = []
+        self.future = future
+
+    @property
+    def remaining(self) -> int:
+        return self.patches.shape[0] - self.taken
+
+
+class PatchBatcher:
+    """
+    Coalesces patches from concurrent requests into shared forward passes
+
+    Every request's patches have the same shape, so the tail of one image
+    and a small image from another request can fill the same BATCH_SIZE
+    batch instead of each running a partial batch. Requests are served in
+    arrival order; a single drain task feeds the inference executor.
+    """
+
+    def __init__(self, model: RealESRGAN, executor: Executor, scale: Optional[int] = None):
+        self.model = model
+        self.executor = executor
+        self.scale = scale or model.scale
+        self._pending: Deque[_PatchJob] = deque()
+        self._drainer: Optional[asyncio.Task] = None
+
+    async def upscale(self, image: torch.Tensor) -> torch.Tensor:
+        """
+        Upscale a decoded image, sharing forward passes with concurrent callers
+
+        Args:
+            image: uint8 RGB tensor of shape (3, H, W)
+
+        Returns:
+            uint8 RGB CPU tensor of shape (3, H * scale, W * scale)
+        """
+        loop = asyncio.get_running_loop()
+        _, height, width = image.shape
+
+        patches, rows, cols = await loop.run_in_executor(
+            self.executor, extract_patches, self.model, image
+        )
+
+        job = _PatchJob(patches, loop.create_future())
+        self._pending.append(job)
+
+        drainer = self._drainer
+        if drainer is None or drainer.done() or drainer.get_loop() is not loop:
+            self._drainer = loop.create_task(self._drain())
+
+        await job.future
+        return await loop.run_in_executor(
+            self.executor, _stitch_tiles, job.tiles, rows, cols, height, width, self.scale
+        )
+
+    def _queued(self) -> int:
+        """Patches waiting to be sent"""
+        return sum(job.remaining for job in self._pending)
+
+    async def _drain(self):
+        """Send batches until no request has patches left"""
+        loop = asyncio.get_running_loop()
+
+        while self._pending:
+            # Give a partial batch a short window to fill from other requests
+            deadline = loop.time() + BATCH_WINDOW_SECONDS
+            while self._queued() < BATCH_SIZE and loop.time() < deadline:
+                await asyncio.sleep(BATCH_POLL_SECONDS)
+
+            batch: List[_PatchJob] = []
+            slices: List[torch.Tensor] = []
+            room = BATCH_SIZE
+
+            while self._pending and room:
+                job = self._pending[0]
+                count = min(room, job.remaining)
+                slices.append(job.patches[job.taken:job.taken + count])
+                batch.append(job)
+                job.taken += count
+                room -= count
+                if not job.remaining:
+                    self._pending.popleft()
+
+            counts = [piece.shape[0] for piece in slices]
+
+            try:
+                tiles = await loop.run_in_executor(self.executor, _forward_batch, self.model, slices, self.scale)
+            except Exception as exc:
+                # Fail every request in the batch; drop any patches they still have queued
+                for job in batch:
+                    if job in self._pending:
+                        self._pending.remove(job)
+                    if not job.future.done():
+                        job.future.set_exception(exc)
+                continue
+
+            for job, job_tiles in zip(batch, tiles.split(counts)):
+                job.tiles.append(job_tiles)
+                if not job.remaining and not job.future.done():
+                    job.future.set_result(None)
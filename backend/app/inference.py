@@ -0,0 +1,365 @@
+# ============================================================
+# Tensor-level Real-ESRGAN Inference
+# ============================================================
+
+import importlib.util
+import io
+from typing import Optional, Tuple, Union
+
+import torch
+import torch.nn.functional as F
+import torchvision.io as tvio
+from PIL import Image
+from py_real_esrgan.model import RealESRGAN
+
+# Optional TensorRT backend for torch.compile (pip install torch-tensorrt)
+try:
+    import torch_tensorrt  # noqa: F401  registers the "tensorrt" backend
+    TENSORRT_AVAILABLE = True
+except ImportError:
+    TENSORRT_AVAILABLE = False
+
+# Inductor generates Triton kernels for CUDA (no Triton on e.g. Windows)
+INDUCTOR_AVAILABLE = importlib.util.find_spec("triton") is not None
+
+# ============================================================
+# Patch Configuration (matches RealESRGAN.predict defaults)
+# ============================================================
+
+PATCH_SIZE = 192       # Patch edge in input pixels
+PATCH_PADDING = 24     # Overlap added around each patch
+PAD_SIZE = 15          # Mirror padding around the whole image
+BATCH_SIZE = 4         # Patches per forward pass
+
+
+# ============================================================
+# Decoding / Encoding
+# ============================================================
+
+def decode_image_tensor(contents: Union[bytes, bytearray], pin_memory: bool = False) -> torch.Tensor:
+    """
+    Decode PNG/JPEG/WebP bytes straight to a tensor (no PIL round-trip)
+
+    Args:
+        contents: Encoded image bytes (a bytearray is wrapped without copying)
+        pin_memory: Return the pixels in page-locked memory, so the copy to
+            a CUDA device runs asynchronously (see extract_patches)
+
+    Returns:
+        uint8 RGB tensor of shape (3, H, W)
+    """
+    if not isinstance(contents, bytearray):
+        contents = bytearray(contents)
+
+    data = torch.frombuffer(contents, dtype=torch.uint8)
+    image = tvio.decode_image(data, mode=tvio.ImageReadMode.RGB)
+
+    # 16-bit PNGs decode to uint16; keep the high byte
+    if image.dtype != torch.uint8:
+        image = (image.to(torch.int32) >> 8).to(torch.uint8)
+
+    if pin_memory:
+        # Served from PyTorch's caching host allocator, so no cudaHostAlloc per request
+        image = image.pin_memory()
+
+    return image
+
+
+def encode_png(image: torch.Tensor, compression_level: int = 6) -> bytes:
+    """
+    Encode a uint8 (3, H, W) CPU tensor to PNG bytes
+
+    Args:
+        image: uint8 RGB tensor
+        compression_level: zlib level (0-9)
+
+    Returns:
+        PNG file bytes
+    """
+    return tvio.encode_png(image, compression_level=compression_level).numpy().tobytes()
+
+
+def encode_jpeg(image: torch.Tensor, quality: int = 90) -> bytes:
+    """
+    Encode a uint8 (3, H, W) CPU tensor to JPEG bytes
+
+    Args:
+        image: uint8 RGB tensor
+        quality: JPEG quality (1-100)
+
+    Returns:
+        JPEG file bytes
+    """
+    return tvio.encode_jpeg(image, quality=quality).numpy().tobytes()
+
+
+def encode_webp(image: torch.Tensor, quality: int = 90, method: int = 4) -> bytes:
+    """
+    Encode a uint8 (3, H, W) CPU tensor to WebP bytes
+
+    Args:
+        image: uint8 RGB tensor
+        quality: WebP quality (0-100)
+        method: Encoder effort (0 fast - 6 slow)
+
+    Returns:
+        WebP file bytes
+    """
+    _, height, width = image.shape
+    pixels = image.permute(1, 2, 0).contiguous().numpy()
+
+    # Wrap the HWC buffer without another copy
+    pil_image = Image.frombuffer("RGB", (width, height), pixels, "raw", "RGB", 0, 1)
+
+    buffer = io.BytesIO()
+    pil_image.save(buffer, format="WEBP", quality=quality, method=method)
+    return buffer.getvalue()
+
+
+# ============================================================
+# Inference
+# ============================================================
+
+def _pad_symmetric(x: torch.Tensor, pad: int) -> torch.Tensor:
+    """Mirror-pad H and W including the edge pixel (as predict's pad_reflect)"""
+    if min(x.shape[-2:]) < pad:
+        return F.pad(x, (pad, pad, pad, pad), mode="replicate")
+
+    x = torch.cat((x[..., :pad, :].flip(-2), x, x[..., -pad:, :].flip(-2)), dim=-2)
+    return torch.cat((x[..., :pad].flip(-1), x, x[..., -pad:].flip(-1)), dim=-1)
+
+
+def prepare_cuda_model(model: RealESRGAN):
+    """
+    Convert a loaded model for fast CUDA inference, in place
+
+    FP16 halves memory traffic and runs the convs on tensor cores;
+    channels_last (NHWC) is the layout those tensor-core kernels use, so
+    cuDNN skips a transpose around every conv.
+
+    Args:
+        model: Loaded RealESRGAN wrapper on a CUDA device
+    """
+    model.model.half().to(memory_format=torch.channels_last)
+
+
+def compile_model(model: RealESRGAN) -> Optional[str]:
+    """
+    Compile the RRDBNet forward for CUDA, in place
+
+    Uses TensorRT engines when torch_tensorrt is installed, otherwise
+    Inductor with CUDA graphs (fused conv epilogues, one graph launch per
+    forward). Patches always have the same spatial size, so only the batch
+    sizes 1..BATCH_SIZE need compiling; run each once (see
+    load_and_warm_models) to pay for it before serving. Built TensorRT
+    engines are cached on disk and reused across restarts.
+
+    Args:
+        model: RealESRGAN wrapper already prepared with prepare_cuda_model
+
+    Returns:
+        Backend name, or None if neither backend is available (stays eager)
+    """
+    if TENSORRT_AVAILABLE:
+        model.model = torch.compile(
+            model.model,
+            backend="tensorrt",
+            dynamic=False,
+            options={
+                "enabled_precisions": {torch.half},
+                "cache_built_engines": True,
+                "reuse_cached_engines": True,
+            }
+        )
+        return "tensorrt"
+
+    if INDUCTOR_AVAILABLE:
+        # forward_patches copies each output before the next call, as CUDA graphs require
+        model.model = torch.compile(model.model, mode="reduce-overhead", dynamic=False, fullgraph=True)
+        return "inductor"
+
+    return None
+
+
+@torch.inference_mode()
+def extract_patches(model: RealESRGAN, image: torch.Tensor) -> Tuple[torch.Tensor, int, int]:
+    """
+    Pad an image and cut it into overlapping model-input patches
+
+    Args:
+        model: Loaded RealESRGAN wrapper (sets device and dtype)
+        image: uint8 RGB tensor of shape (3, H, W)
+
+    Returns:
+        (patches, rows, cols): patches of shape (rows * cols, 3, window, window)
+        on the model's device in the weights' dtype
+    """
+    # Match the weights' precision (FP16 on CUDA, FP32 on CPU). The copy is
+    # asynchronous when the image is pinned (decode_image_tensor(pin_memory=True))
+    dtype = next(model.model.parameters()).dtype
+    x = image.to(model.device, non_blocking=True).unsqueeze(0).to(dtype).div_(255)
+
+    # Mirror-pad the whole image, extend to a whole number of patches,
+    # then add the overlap border (edge-replicated like predict)
+    x = _pad_symmetric(x, PAD_SIZE)
+    padded_h, padded_w = x.shape[-2:]
+    extend_h = -padded_h % PATCH_SIZE
+    extend_w = -padded_w % PATCH_SIZE
+    x = F.pad(
+        x,
+        (PATCH_PADDING, PATCH_PADDING + extend_w, PATCH_PADDING, PATCH_PADDING + extend_h),
+        mode="replicate"
+    )
+
+    window = PATCH_SIZE + 2 * PATCH_PADDING
+    patches = x.unfold(2, window, PATCH_SIZE).unfold(3, window, PATCH_SIZE)
+    rows, cols = patches.shape[2], patches.shape[3]
+    patches = patches.permute(0, 2, 3, 1, 4, 5).reshape(rows * cols, 3, window, window)
+
+    if patches.is_cuda:
+        # Same NHWC layout as the weights (see prepare_cuda_model)
+        patches = patches.contiguous(memory_format=torch.channels_last)
+
+    return patches, rows, cols
+
+
+@torch.inference_mode()
+def forward_patches(model: RealESRGAN, patches: torch.Tensor, scale: Optional[int] = None) -> torch.Tensor:
+    """
+    Run one forward pass over a batch of patches and quantize the result
+
+    Args:
+        model: Loaded RealESRGAN wrapper
+        patches: Batch from extract_patches (any mix of images)
+        scale: Output scale (default: the model's). A smaller scale resizes
+            each result (antialiased bicubic) before the overlap is cropped,
+            so tiles still join without seams
+
+    Returns:
+        uint8 tiles of shape (N, 3, PATCH_SIZE * scale, PATCH_SIZE * scale)
+        with the overlap cropped off, on the model's device
+    """
+    scale = scale or model.scale
+    out_patch = PATCH_SIZE * scale
+    out_pad = PATCH_PADDING * scale
+
+    result = model.model(patches)
+    if scale != model.scale:
+        # Clamp first, as resizing the finished image would
+        result = F.interpolate(
+            result.float().clamp_(0, 1),
+            scale_factor=scale / model.scale,
+            mode="bicubic",
+            align_corners=False,
+            antialias=True
+        )
+    result = result[:, :, out_pad:out_pad + out_patch, out_pad:out_pad + out_patch]
+    return result.float().clamp_(0, 1).mul_(255).round_().to(torch.uint8)
+
+
+# Side stream for device-to-host tile copies (created on first CUDA use)
+_copy_stream: Optional["torch.cuda.Stream"] = None
+
+
+def offload_tiles(tiles: torch.Tensor) -> torch.Tensor:
+    """
+    Start copying a batch of finished tiles to pinned host memory
+
+    The copy runs on a side stream, so it overlaps the next batch's
+    forward, and the device only ever holds one batch of output instead
+    of the whole upscaled image. Call wait_for_offload() before reading
+    the returned tensor.
+
+    Args:
+        tiles: uint8 tiles from forward_patches
+
+    Returns:
+        Host tensor the tiles are being copied into (tiles itself on CPU)
+    """
+    global _copy_stream
+
+    if not tiles.is_cuda:
+        return tiles
+
+    if _copy_stream is None:
+        _copy_stream = torch.cuda.Stream(tiles.device)
+
+    host = torch.empty_like(tiles, device="cpu", pin_memory=True)
+    _copy_stream.wait_stream(torch.cuda.current_stream(tiles.device))
+    with torch.cuda.stream(_copy_stream):
+        host.copy_(tiles, non_blocking=True)
+
+    # Keep the allocator from reusing the device tiles until the copy is done
+    tiles.record_stream(_copy_stream)
+    return host
+
+
+def wait_for_offload():
+    """Block until every tile copy started by offload_tiles has landed"""
+    if _copy_stream is not None:
+        _copy_stream.synchronize()
+
+
+@torch.inference_mode()
+def stitch_patches(
+    tiles: torch.Tensor,
+    rows: int,
+    cols: int,
+    height: int,
+    width: int,
+    scale: int
+) -> torch.Tensor:
+    """
+    Reassemble upscaled tiles in row-major order and crop off the padding
+
+    Runs on the CPU; device tiles are copied over first.
+
+    Args:
+        tiles: uint8 tiles from forward_patches, one per extracted patch
+        rows: Patch rows from extract_patches
+        cols: Patch columns from extract_patches
+        height: Input image height
+        width: Input image width
+        scale: Upscaling factor
+
+    Returns:
+        uint8 RGB CPU tensor of shape (3, height * scale, width * scale)
+    """
+    tiles = tiles.cpu()
+    out_patch = tiles.shape[-1]
+    output = tiles.view(rows, cols, 3, out_patch, out_patch).permute(2, 0, 3, 1, 4)
+    output = output.reshape(3, rows * out_patch, cols * out_patch)
+
+    top = PAD_SIZE * scale
+    return output[:, top:top + height * scale, top:top + width * scale]
+
+
+@torch.inference_mode()
+def upscale_tensor(model: RealESRGAN, image: torch.Tensor, scale: Optional[int] = None) -> torch.Tensor:
+    """
+    Upscale a decoded image by calling the RRDBNet forward directly
+
+    Mirrors RealESRGAN.predict (mirror pad, overlapping patches, batched
+    forward, stitch) but stays in torch end to end, so there is no PIL or
+    NumPy conversion and the output is quantized on the model's device.
+    Runs in the weights' dtype, so an FP16 model gets FP16 input.
+
+    Args:
+        model: Loaded RealESRGAN wrapper
+        image: uint8 RGB tensor of shape (3, H, W)
+        scale: Output scale, at most the model's (see forward_patches)
+
+    Returns:
+        uint8 RGB CPU tensor of shape (3, H * scale, W * scale)
+    """
+    scale = scale or model.scale
+    _, height, width = image.shape
+    patches, rows, cols = extract_patches(model, image)
+
+    tiles = [
+        offload_tiles(forward_patches(model, patches[start:start + BATCH_SIZE], scale))
+        for start in range(0, patches.shape[0], BATCH_SIZE)
+    ]
+    wait_for_offload()
+
+    return stitch_patches(torch.cat(tiles), rows, cols, height, width, scale)
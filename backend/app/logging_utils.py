@@ -2,20 +2,36 @@
 # Logging and Progress Tracking for ESRGAN Processing
 # ============================================================
 
+import atexit
 import logging
+import queue
+import time
 from enum import Enum
-from typing import Dict, Any, Optional
-from datetime import datetime
-import json
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import orjson
 
 # ============================================================
 # Configure Logger
 # ============================================================
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Request handlers only enqueue records; a background listener thread owns
+# the stream handler so console I/O never blocks the event loop.
+_log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+_stream_handler = logging.StreamHandler()
+_stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+log_listener = QueueListener(_log_queue, _stream_handler, respect_handler_level=True)
+
+_root_logger = logging.getLogger()
+_root_logger.setLevel(logging.INFO)
+_root_logger.addHandler(QueueHandler(_log_queue))
+
+log_listener.start()
+atexit.register(log_listener.stop)
 
 logger = logging.getLogger("esrgan")
 
@@ -36,6 +52,10 @@ class ProcessingStage(str, Enum):
     ENCODING = "encoding"
     COMPLETED = "completed"
     ERROR = "error"
+    
+    def __init__(self, value: str):
+        # Position in definition order; indexes STAGE_TABLE and STAGE_FRAME_BUILDERS
+        self.idx = len(type(self).__members__)
 
 
 # Stage metadata for frontend display
@@ -93,6 +113,44 @@ STAGE_METADATA: Dict[ProcessingStage, Dict[str, Any]] = {
 }
 
 
+# Per-stage immutables resolved once, indexed by stage.idx (no enum hashing
+# on the hot path): (description, progress, estimated_duration, log prefix)
+STAGE_TABLE: Tuple[Tuple[str, int, float, str], ...] = tuple(
+    (
+        STAGE_METADATA[stage]["description"],
+        STAGE_METADATA[stage]["progress"],
+        STAGE_METADATA[stage]["estimated_duration"],
+        f"[{stage.value.upper()}] {STAGE_METADATA[stage]['description']}",
+    )
+    for stage in ProcessingStage
+)
+
+
+# Static head of each stage's SSE frame, serialized once at import time.
+# The closing brace is left off so per-event fields can be appended.
+STAGE_SSE_PREFIX: Dict[ProcessingStage, bytes] = {
+    stage: b"data: " + orjson.dumps({
+        "stage": stage.value,
+        "description": metadata["description"],
+        "progress": metadata["progress"],
+    })[:-1]
+    for stage, metadata in STAGE_METADATA.items()
+}
+
+
+def _make_frame_builder(prefix: bytes) -> Callable[[bytes], bytes]:
+    """Specialize a frame builder for one stage: prefix + timestamp + fields"""
+    def build(fields: bytes) -> bytes:
+        return b"".join((prefix, b',"ts":', repr(time.time()).encode(), fields, b"\n\n"))
+    return build
+
+
+# Per-stage frame builders indexed by stage.idx; callers pass the tail from encode_sse_fields()
+STAGE_FRAME_BUILDERS: Tuple[Callable[[bytes], bytes], ...] = tuple(
+    _make_frame_builder(STAGE_SSE_PREFIX[stage]) for stage in ProcessingStage
+)
+
+
 # ============================================================
 # Progress Event Generation
 # ============================================================
@@ -111,13 +169,13 @@ def create_progress_event(
     Returns:
         Dictionary containing progress event data
     """
-    metadata = STAGE_METADATA[stage]
+    description, progress, _, _ = STAGE_TABLE[stage.idx]
     
     event = {
         "stage": stage.value,
-        "description": metadata["description"],
-        "progress": metadata["progress"],
-        "timestamp": datetime.utcnow().isoformat(),
+        "description": description,
+        "progress": progress,
+        "ts": time.time(),
     }
     
     if additional_info:
@@ -126,7 +184,7 @@ def create_progress_event(
     return event
 
 
-def format_sse_message(data: Dict[str, Any]) -> str:
+def format_sse_message(data: Dict[str, Any]) -> bytes:
     """
     Format data as Server-Sent Events (SSE) message
     
@@ -134,15 +192,45 @@ def format_sse_message(data: Dict[str, Any]) -> str:
         data: Dictionary to send as SSE
     
     Returns:
-        Formatted SSE string
+        Encoded SSE frame
+    """
+    return b"data: " + orjson.dumps(data) + b"\n\n"
+
+
+def encode_sse_fields(additional_info: Optional[Dict[str, Any]] = None) -> bytes:
+    """
+    Serialize the per-job fields that close an SSE progress frame
+    
+    The result only changes when the job's fields do, so streams can
+    compute it once and reuse it for every frame.
+    
+    Args:
+        additional_info: Optional additional information (image dimensions, scale, etc.)
+    
+    Returns:
+        Encoded JSON tail, including the closing brace
     """
-    return f"data: {json.dumps(data)}\n\n"
+    if additional_info:
+        return b"," + orjson.dumps(additional_info)[1:]
+    return b"}"
 
 
 # ============================================================
 # Logging Helper Functions
 # ============================================================
 
+class _KeyValues:
+    """Renders key/value pairs as "k=v | k=v" only when a record is emitted"""
+    
+    __slots__ = ("items",)
+    
+    def __init__(self, items: Dict[str, Any]):
+        self.items = items
+    
+    def __str__(self) -> str:
+        return " | ".join(f"{k}={v}" for k, v in self.items.items())
+
+
 def log_stage(
     stage: ProcessingStage,
     additional_info: Optional[Dict[str, Any]] = None,
@@ -156,14 +244,15 @@ def log_stage(
         additional_info: Optional additional information
         level: Logging level (default: INFO)
     """
-    metadata = STAGE_METADATA[stage]
-    message = f"[{stage.value.upper()}] {metadata['description']}"
+    if not logger.isEnabledFor(level):
+        return
     
-    if additional_info:
-        info_str = " | ".join(f"{k}={v}" for k, v in additional_info.items())
-        message = f"{message} | {info_str}"
+    prefix = STAGE_TABLE[stage.idx][3]
     
-    logger.log(level, message)
+    if additional_info:
+        logger.log(level, "%s | %s", prefix, _KeyValues(additional_info))
+    else:
+        logger.log(level, "%s", prefix)
 
 
 def log_error(stage: ProcessingStage, error: Exception, context: Optional[Dict[str, Any]] = None):
@@ -184,8 +273,7 @@ def log_error(stage: ProcessingStage, error: Exception, context: Optional[Dict[s
     if context:
         error_info.update(context)
     
-    context_str = " | ".join(f"{k}={v}" for k, v in error_info.items())
-    logger.error(f"[ERROR] {context_str}")
+    logger.error("[ERROR] %s", _KeyValues(error_info))
 
 
 def log_image_info(stage: ProcessingStage, width: int, height: int, scale: int):
@@ -198,6 +286,9 @@ def log_image_info(stage: ProcessingStage, width: int, height: int, scale: int):
         height: Image height
         scale: Upscaling factor
     """
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    
     log_stage(
         stage,
         {
@@ -216,6 +307,9 @@ def log_performance(stage: ProcessingStage, duration_seconds: float):
         stage: Completed processing stage
         duration_seconds: Time taken in seconds
     """
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    
     log_stage(
         stage,
         {
@@ -3,22 +3,38 @@
 # ============================================================
 
 import asyncio
-import base64
-import io
+import itertools
 import logging
+import re
 import time
-import uuid
-from typing import AsyncGenerator, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, Dict, Optional, Set
 
-from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+import orjson
+from fastapi import FastAPI, File, Form, HTTPException, Query, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse
-from PIL import Image
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from py_real_esrgan.model import RealESRGAN
 
+from app.batching import PatchBatcher
+from app.inference import (
+    BATCH_SIZE,
+    PATCH_PADDING,
+    PATCH_SIZE,
+    compile_model,
+    decode_image_tensor,
+    encode_jpeg,
+    encode_png,
+    encode_webp,
+    forward_patches,
+    prepare_cuda_model,
+)
 from app.logging_utils import (
+    STAGE_FRAME_BUILDERS,
     ProcessingStage,
-    create_progress_event,
+    encode_sse_fields,
     format_sse_message,
     log_error,
     log_image_info,
@@ -30,17 +46,25 @@ from app.logging_utils import (
 # Logging Configuration
 # ============================================================
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Handlers are installed by app.logging_utils (queue-backed, off the event loop)
 logger = logging.getLogger("esrgan")
 
 # ============================================================
 # FastAPI Application
 # ============================================================
 
-app = FastAPI(title="ESRGAN Interface API", version="2.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Load and warm every model on the inference thread before serving requests"""
+    await asyncio.get_running_loop().run_in_executor(torch_pool, load_and_warm_models)
+    yield
+
+app = FastAPI(
+    title="ESRGAN Interface API",
+    version="2.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
+)
 
 # CORS configuration
 app.add_middleware(
@@ -49,6 +73,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "X-Job-Id",
+        "X-Scale",
+        "X-Input-Dimensions",
+        "X-Output-Dimensions",
+        "X-Processing-Time",
+        "X-Upscaling-Time",
+        "X-Encoding-Time",
+    ],
 )
 
 # ============================================================
@@ -58,81 +91,349 @@ app.add_middleware(
 # Global model cache
 models: Dict[int, RealESRGAN] = {}
 
+# One patch batcher per model, shared by all requests at that scale
+batchers: Dict[int, PatchBatcher] = {}
+
 # Supported scale configurations
-SCALE_CONFIGS = {
+SCALE_CONFIGS: Dict[int, str] = {
     2: "weights/RealESRGAN_x2.pth",
     4: "weights/RealESRGAN_x4.pth"
 }
 
+# Membership set and the list quoted in rejections, built once
+SUPPORTED_SCALES = frozenset(SCALE_CONFIGS)
+SUPPORTED_SCALES_TEXT = str(sorted(SCALE_CONFIGS))
+
+# Scales served by downscaling another scale's model output, e.g. {2: 4}
+# keeps a single set of weights resident. Off by default: the x2 network
+# runs its trunk at half resolution, so 2x via the x4 model costs ~4x the
+# compute per image in exchange for the memory and load time saved.
+DERIVED_SCALES: Dict[int, int] = {}
+
+# Serializes the first load of each scale (see load_batcher)
+model_locks: Dict[int, asyncio.Lock] = {scale: asyncio.Lock() for scale in SCALE_CONFIGS}
+
 # Device configuration (auto-detect)
 try:
     import torch
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-    logger.info(f"Using device: {device}")
+    logger.info("Using device: %s", device)
+    
+    if device.type == "cuda":
+        # Full batches of fixed-size patches repeat across requests, so cuDNN
+        # autotuning pays off (only the last, partial batch varies in size)
+        torch.backends.cudnn.benchmark = True
 except ImportError:
     device = None
     logger.warning("PyTorch not available, using CPU")
 
+# Single worker thread that owns inference: keeps the model forward off the
+# event loop and serializes GPU work from concurrent requests
+torch_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gpu")
+
+# /scales and /health bodies, serialized once and rebuilt only when a model
+# is added (both are polled by health checks and the frontend)
+SCALES_JSON_BYTES = b""
+HEALTH_JSON_BYTES = b""
+
+def refresh_status_bodies():
+    """Re-serialize the /scales and /health bodies from the model cache"""
+    global SCALES_JSON_BYTES, HEALTH_JSON_BYTES
+    
+    supported = list(SCALE_CONFIGS)
+    loaded = list(models)
+    
+    SCALES_JSON_BYTES = orjson.dumps({
+        "scales": supported,
+        "default": 4,
+        "loaded": loaded
+    })
+    HEALTH_JSON_BYTES = orjson.dumps({
+        "status": "healthy",
+        "modelLoaded": len(loaded) > 0,
+        "device": str(device),
+        "loaded_scales": loaded,
+        "supported_scales": supported
+    })
+
+refresh_status_bodies()
+
 def get_or_create_model(scale: int) -> RealESRGAN:
     """Get cached model or create new one for specified scale"""
     if scale not in models:
-        if scale not in SCALE_CONFIGS:
-            raise ValueError(f"Unsupported scale: {scale}x. Supported: {list(SCALE_CONFIGS.keys())}")
-        
-        logger.info(f"Loading Real-ESRGAN model | scale={scale}x | device={device}")
-        models[scale] = RealESRGAN(device, scale=scale)
-        models[scale].load_weights(SCALE_CONFIGS[scale], download=True)
-        logger.info(f"Model loaded successfully | scale={scale}x")
+        if scale not in SUPPORTED_SCALES:
+            raise ValueError(f"Unsupported scale: {scale}x. Supported: {SUPPORTED_SCALES_TEXT}")
+        
+        logger.info("Loading Real-ESRGAN model | scale=%sx | device=%s", scale, device)
+        # Only cache the model once its weights are in (a failed load is retried)
+        model = RealESRGAN(device, scale=scale)
+        model.load_weights(SCALE_CONFIGS[scale], download=True)
+        
+        if device.type == "cuda":
+            prepare_cuda_model(model)
+            
+            backend = compile_model(model)
+            if backend:
+                logger.info("Model compiled, kernels build on warm-up | backend=%s | scale=%sx", backend, scale)
+            
+            # Release the FP32 copies left over from loading the checkpoint
+            torch.cuda.empty_cache()
+        
+        models[scale] = model
+        refresh_status_bodies()
+        logger.info("Model loaded successfully | scale=%sx", scale)
     
     return models[scale]
 
+def get_batcher(scale: int) -> PatchBatcher:
+    """Get the shared patch batcher for a scale, loading its model if needed"""
+    if scale not in batchers:
+        model = get_or_create_model(DERIVED_SCALES.get(scale, scale))
+        batchers[scale] = PatchBatcher(model, torch_pool, scale)
+    return batchers[scale]
+
+async def load_batcher(scale: int) -> PatchBatcher:
+    """Get a scale's batcher, loading it on the inference thread; concurrent first hits share one load"""
+    batcher = batchers.get(scale)
+    if batcher is not None:
+        return batcher
+    
+    async with model_locks[scale]:
+        if scale not in batchers:
+            await asyncio.get_running_loop().run_in_executor(torch_pool, get_batcher, scale)
+        return batchers[scale]
+
+def load_and_warm_models():
+    """Load every configured scale with its batcher and, on CUDA, run each batch shape once"""
+    window = PATCH_SIZE + 2 * PATCH_PADDING
+    
+    for scale in SCALE_CONFIGS:
+        batcher = get_batcher(scale)
+        model = batcher.model
+        
+        if device.type == "cuda":
+            # Every forward is 1..BATCH_SIZE fixed-size patches: autotune cuDNN
+            # (or build the compiled kernels) for each shape before real traffic
+            warm_start = time.time()
+            dtype = next(model.model.parameters()).dtype
+            for batch in range(1, BATCH_SIZE + 1):
+                patches = torch.zeros((batch, 3, window, window), dtype=dtype, device=device)
+                forward_patches(model, patches.contiguous(memory_format=torch.channels_last), batcher.scale)
+            torch.cuda.synchronize()
+            logger.info("Model warmed up | scale=%sx | duration=%.2fs", scale, time.time() - warm_start)
+
+# ============================================================
+# Upload Handling
+# ============================================================
+
+# Same limit the frontend enforces in validateImageFile()
+MAX_UPLOAD_BYTES = 20 * 1024 * 1024
+
+# Enough leading bytes to identify every accepted format
+IMAGE_SIGNATURE_BYTES = 12
+
+def sniff_image_type(header: bytes) -> Optional[str]:
+    """Media type from a file's leading bytes, or None if it is not PNG/JPEG/WebP"""
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if header.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    # RIFF container: "RIFF" + 4-byte size + "WEBP"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+async def read_upload(file: UploadFile) -> bytearray:
+    """Read an upload into a bytearray the decoder can wrap without copying, enforcing MAX_UPLOAD_BYTES"""
+    await file.seek(0)
+    
+    # One byte past the limit is enough to detect an oversized body. Read via
+    # UploadFile.read: SpooledTemporaryFile has no readinto before Python 3.11
+    contents = bytearray(await file.read(MAX_UPLOAD_BYTES + 1))
+    
+    if len(contents) > MAX_UPLOAD_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File too large. Maximum: {MAX_UPLOAD_BYTES} bytes"
+        )
+    
+    return contents
+
+# ============================================================
+# Image Encoding
+# ============================================================
+
+# ?quality= presets, fastest encode first, smallest file last
+QUALITY_PRESETS = ("fast", "balanced", "small")
+
+# ?format= choices: media type and an encoder per quality preset (run in a worker thread)
+OUTPUT_FORMATS = {
+    "png": ("image/png", {
+        # zlib level 1 encodes roughly 3x faster than the default of 6
+        "fast": partial(encode_png, compression_level=1),
+        "balanced": partial(encode_png, compression_level=6),
+        "small": partial(encode_png, compression_level=9),
+    }),
+    "webp": ("image/webp", {
+        # Lossy WebP is typically a quarter to a third smaller than PNG on the wire
+        "fast": partial(encode_webp, quality=90, method=4),
+        "balanced": partial(encode_webp, quality=85, method=5),
+        "small": partial(encode_webp, quality=80, method=6),
+    }),
+    "jpeg": ("image/jpeg", {
+        # Fastest to encode of the three; quality only trades size for artifacts
+        "fast": partial(encode_jpeg, quality=95),
+        "balanced": partial(encode_jpeg, quality=90),
+        "small": partial(encode_jpeg, quality=80),
+    }),
+}
+
 # ============================================================
 # Progress Tracking
 # ============================================================
 
-active_jobs: Dict[str, Dict] = {}
+class Job:
+    """Progress state for one upscale request, shared with its SSE streams"""
+    
+    __slots__ = (
+        "stage",
+        "stage_seq",
+        "claimed",
+        "cond",
+        "scale",
+        "input_dimensions",
+        "output_dimensions",
+        "error_message",
+        "processing_time",
+    )
+    
+    def __init__(self, scale: Optional[int], claimed: bool):
+        self.stage = ProcessingStage.INITIALIZING
+        self.stage_seq = 0
+        self.claimed = claimed
+        self.cond = asyncio.Condition()
+        self.scale = scale
+        self.input_dimensions: Optional[str] = None
+        self.output_dimensions: Optional[str] = None
+        self.error_message: Optional[str] = None
+        self.processing_time: Optional[str] = None
 
-async def progress_generator(job_id: str) -> AsyncGenerator[str, None]:
+active_jobs: Dict[str, Job] = {}
+
+# Client-supplied job ids end up in the X-Job-Id header and the SSE URL
+JOB_ID_PATTERN = re.compile(r"[A-Za-z0-9_.-]{1,128}")
+
+# Per-process sequence that keeps ids unique within the same nanosecond
+_job_id_counter = itertools.count()
+
+# How long an SSE client waits for /upscale to register its job
+JOB_WAIT_SECONDS = 5
+
+# How long a finished job stays in active_jobs for SSE clients to read
+JOB_RETENTION_SECONDS = 60
+
+# Stages after which a job publishes nothing more
+TERMINAL_STAGES = frozenset({ProcessingStage.COMPLETED, ProcessingStage.ERROR})
+
+def new_job_id() -> str:
+    """Time-ordered job id: nanosecond clock plus a 16-bit counter (no urandom syscall)"""
+    return f"{time.time_ns():016x}{next(_job_id_counter) & 0xffff:04x}"
+
+def create_job(job_id: str, scale: Optional[int]) -> Job:
+    """Register a new job, taking over the placeholder an early SSE client may have left"""
+    job = active_jobs.get(job_id)
+    if job is not None and not job.claimed:
+        job.scale = scale
+        job.claimed = True
+        return job
+    
+    job = Job(scale, claimed=True)
+    active_jobs[job_id] = job
+    return job
+
+def reserve_job(job_id: str) -> Job:
+    """Get a job for an SSE client, leaving an unclaimed placeholder if /upscale has not registered it yet"""
+    job = active_jobs.get(job_id)
+    if job is None:
+        job = active_jobs.setdefault(job_id, Job(None, claimed=False))
+    return job
+
+def expire_job(job_id: str, job: Job):
+    """Remove a finished job, unless the id has since been reused by a newer job"""
+    if active_jobs.get(job_id) is job:
+        del active_jobs[job_id]
+
+async def set_stage(job: Job, stage: ProcessingStage):
+    """Update a job's stage and wake any SSE streams waiting on it"""
+    async with job.cond:
+        job.stage = stage
+        job.stage_seq += 1
+        job.cond.notify_all()
+
+# Strong references to ERROR publishes scheduled by finish_job until they run
+_closing_tasks: Set[asyncio.Task] = set()
+
+def finish_job(job_id: str, job: Job):
+    """
+    Close out a job once its handler exits: publish ERROR if the handler
+    stopped mid-stage (e.g. cancelled) so waiting streams end, then
+    schedule its expiry
+    """
+    loop = asyncio.get_running_loop()
+    
+    if job.stage not in TERMINAL_STAGES:
+        job.error_message = job.error_message or "Request aborted"
+        task = loop.create_task(set_stage(job, ProcessingStage.ERROR))
+        _closing_tasks.add(task)
+        task.add_done_callback(_closing_tasks.discard)
+    
+    # Leave the final stage readable for late SSE clients, then drop it
+    loop.call_later(JOB_RETENTION_SECONDS, expire_job, job_id, job)
+
+async def progress_generator(job_id: str) -> AsyncGenerator[bytes, None]:
     """Generate Server-Sent Events for progress updates"""
-    logger.info(f"[SSE] Started progress stream | job_id={job_id}")
+    logger.info("[SSE] Started progress stream | job_id=%s", job_id)
     
-    last_stage = None
+    # Hold on to this job even if it expires or its id is reused mid-stream
+    job_data = active_jobs.get(job_id)
+    if job_data is None:
+        logger.info("[SSE] Job not found, closing stream | job_id=%s", job_id)
+        return
+    
+    cond = job_data.cond
+    last_seq = -1
+    last_fields_key = None
     
     while True:
-        if job_id not in active_jobs:
-            logger.info(f"[SSE] Job not found, closing stream | job_id={job_id}")
-            break
+        # Sleep until the upscale handler publishes a newer stage
+        async with cond:
+            await cond.wait_for(lambda: job_data.stage_seq > last_seq)
+            last_seq = job_data.stage_seq
+            current_stage = job_data.stage
+        
+        # Per-job fields rarely change; re-serialize them only when they do
+        fields_key = (job_data.input_dimensions, job_data.output_dimensions)
+        if fields_key != last_fields_key:
+            fields = encode_sse_fields({
+                "job_id": job_id,
+                "scale": job_data.scale,
+                "input_dimensions": fields_key[0],
+                "output_dimensions": fields_key[1],
+            })
+            last_fields_key = fields_key
         
-        job_data = active_jobs[job_id]
-        current_stage = job_data["stage"]
-        
-        # Only send event if stage changed
-        if current_stage != last_stage:
-            event = create_progress_event(
-                ProcessingStage(current_stage),
-                {
-                    "job_id": job_id,
-                    "scale": job_data.get("scale"),
-                    "input_dimensions": job_data.get("input_dimensions"),
-                    "output_dimensions": job_data.get("output_dimensions"),
-                }
-            )
-            logger.info(f"[SSE] Sending event | job_id={job_id} | stage={current_stage}")
-            yield format_sse_message(event)
-            last_stage = current_stage
-        
-        # Check if completed or errored
-        if current_stage in [ProcessingStage.COMPLETED.value, ProcessingStage.ERROR.value]:
-            if current_stage == ProcessingStage.ERROR.value:
-                error_msg = job_data.get("error_message", "Unknown error")
-                logger.error(f"[SSE] Error occurred | job_id={job_id} | error={error_msg}")
+        logger.info("[SSE] Sending event | job_id=%s | stage=%s", job_id, current_stage.value)
+        yield STAGE_FRAME_BUILDERS[current_stage.idx](fields)
+        
+        if current_stage in TERMINAL_STAGES:
+            if current_stage == ProcessingStage.ERROR:
+                error_msg = job_data.error_message or "Unknown error"
+                logger.error("[SSE] Error occurred | job_id=%s | error=%s", job_id, error_msg)
                 yield format_sse_message({"error": error_msg})
-            logger.info(f"[SSE] Job finished, closing stream | job_id={job_id}")
+            logger.info("[SSE] Job finished, closing stream | job_id=%s", job_id)
             break
-        
-        await asyncio.sleep(0.3)  # Poll every 300ms
     
-    logger.info(f"[SSE] Stream closed | job_id={job_id}")
+    logger.info("[SSE] Stream closed | job_id=%s", job_id)
 
 # ============================================================
 # API Endpoints
@@ -142,7 +443,9 @@ async def progress_generator(job_id: str) -> AsyncGenerator[str, None]:
 async def upscale_image(
     file: UploadFile = File(...),
     scale: Optional[int] = Form(4),
-    job_id: Optional[str] = Form(None)
+    job_id: Optional[str] = Form(None),
+    output_format: str = Query("png", alias="format"),
+    quality: str = Query("fast")
 ):
     """
     Upscale image using Real-ESRGAN with detailed progress tracking
@@ -151,177 +454,193 @@ async def upscale_image(
     
     # Generate job ID if not provided
     if not job_id:
-        job_id = str(uuid.uuid4())
+        job_id = new_job_id()
+    elif not JOB_ID_PATTERN.fullmatch(job_id):
+        raise HTTPException(status_code=400, detail="Invalid job_id")
     
-    logger.info(f"[REQUEST] New upscale request | job_id={job_id} | scale={scale}x | filename={file.filename}")
+    logger.info("[REQUEST] New upscale request | job_id=%s | scale=%sx | filename=%s", job_id, scale, file.filename)
     
     # Initialize job IMMEDIATELY (before any processing)
-    active_jobs[job_id] = {
-        "stage": ProcessingStage.INITIALIZING.value,
-        "scale": scale
-    }
-    logger.info(f"[JOB] Created in active_jobs | job_id={job_id}")
-    
-    # Give SSE connection time to establish
-    await asyncio.sleep(0.2)
+    job = create_job(job_id, scale)
+    logger.info("[JOB] Created in active_jobs | job_id=%s", job_id)
     
     try:
         # Stage 1: Initialize
         log_stage(ProcessingStage.INITIALIZING, {"job_id": job_id, "scale": f"{scale}x"})
-        logger.info(f"[STAGE 1/9] Initializing | job_id={job_id}")
-        await asyncio.sleep(0.2)
+        logger.info("[STAGE 1/9] Initializing | job_id=%s", job_id)
         
         # Stage 2: Validate
-        active_jobs[job_id]["stage"] = ProcessingStage.VALIDATING.value
-        logger.info(f"[STAGE 2/9] Validating | job_id={job_id} | content_type={file.content_type}")
+        await set_stage(job, ProcessingStage.VALIDATING)
+        logger.info("[STAGE 2/9] Validating | job_id=%s | content_type=%s", job_id, file.content_type)
+        
+        if scale not in SUPPORTED_SCALES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unsupported scale: {scale}x. Supported: {SUPPORTED_SCALES_TEXT}"
+            )
         
-        if scale not in SCALE_CONFIGS:
+        if output_format not in OUTPUT_FORMATS:
             raise HTTPException(
                 status_code=400,
-                detail=f"Unsupported scale: {scale}x. Supported: {list(SCALE_CONFIGS.keys())}"
+                detail=f"Unsupported format: {output_format}. Supported: {list(OUTPUT_FORMATS.keys())}"
+            )
+        
+        if quality not in QUALITY_PRESETS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unsupported quality: {quality}. Supported: {list(QUALITY_PRESETS)}"
             )
         
         if file.content_type not in {"image/png", "image/jpeg", "image/webp", "image/jpg"}:
             raise HTTPException(status_code=400, detail=f"Unsupported file type: {file.content_type}")
         
+        if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"File too large: {file.size} bytes. Maximum: {MAX_UPLOAD_BYTES} bytes"
+            )
+        
+        # Content-Type is client-supplied: check the signature before reading the body
+        if sniff_image_type(await file.read(IMAGE_SIGNATURE_BYTES)) is None:
+            raise HTTPException(status_code=400, detail="File content is not a PNG, JPEG or WebP image")
+        
         log_stage(ProcessingStage.VALIDATING, {"job_id": job_id, "file_type": file.content_type})
-        await asyncio.sleep(0.2)
         
         # Stage 3: Load image
-        active_jobs[job_id]["stage"] = ProcessingStage.LOADING_IMAGE.value
-        logger.info(f"[STAGE 3/9] Loading image | job_id={job_id}")
+        await set_stage(job, ProcessingStage.LOADING_IMAGE)
+        logger.info("[STAGE 3/9] Loading image | job_id=%s", job_id)
         
-        contents = await file.read()
-        logger.info(f"[LOAD] Read {len(contents)} bytes | job_id={job_id}")
+        contents = await read_upload(file)
+        logger.info("[LOAD] Read %s bytes | job_id=%s", len(contents), job_id)
         
         try:
-            image = Image.open(io.BytesIO(contents)).convert("RGB")
-            logger.info(f"[LOAD] Image decoded | job_id={job_id}")
+            image = await asyncio.get_running_loop().run_in_executor(
+                None, decode_image_tensor, contents, device.type == "cuda"
+            )
+            logger.info("[LOAD] Image decoded | job_id=%s", job_id)
         except Exception as exc:
-            logger.error(f"[LOAD] Failed to decode image | job_id={job_id} | error={exc}")
+            logger.error("[LOAD] Failed to decode image | job_id=%s | error=%s", job_id, exc)
             raise HTTPException(status_code=400, detail="Invalid image data") from exc
         
-        width, height = image.size
+        height, width = image.shape[-2:]
         output_width = width * scale
         output_height = height * scale
         
-        active_jobs[job_id]["input_dimensions"] = f"{width}x{height}"
-        active_jobs[job_id]["output_dimensions"] = f"{output_width}x{output_height}"
+        job.input_dimensions = f"{width}x{height}"
+        job.output_dimensions = f"{output_width}x{output_height}"
         
         log_image_info(ProcessingStage.LOADING_IMAGE, width, height, scale)
-        logger.info(f"[LOAD] Dimensions: {width}x{height} → {output_width}x{output_height} | job_id={job_id}")
-        await asyncio.sleep(0.2)
+        logger.info("[LOAD] Dimensions: %sx%s → %sx%s | job_id=%s", width, height, output_width, output_height, job_id)
         
         # Stage 4: Prepare model
-        active_jobs[job_id]["stage"] = ProcessingStage.PREPARING_MODEL.value
-        logger.info(f"[STAGE 4/9] Preparing model | job_id={job_id} | scale={scale}x")
+        await set_stage(job, ProcessingStage.PREPARING_MODEL)
+        logger.info("[STAGE 4/9] Preparing model | job_id=%s | scale=%sx", job_id, scale)
         log_stage(ProcessingStage.PREPARING_MODEL, {"job_id": job_id, "scale": f"{scale}x", "status": "loading"})
         
-        model = get_or_create_model(scale)
+        batcher = await load_batcher(scale)
         
         log_stage(ProcessingStage.PREPARING_MODEL, {"job_id": job_id, "scale": f"{scale}x", "status": "ready"})
-        logger.info(f"[MODEL] Ready | job_id={job_id}")
-        await asyncio.sleep(0.2)
+        logger.info("[MODEL] Ready | job_id=%s", job_id)
         
         # Stage 5: Preprocessing
-        active_jobs[job_id]["stage"] = ProcessingStage.PREPROCESSING.value
-        logger.info(f"[STAGE 5/9] Preprocessing | job_id={job_id}")
+        await set_stage(job, ProcessingStage.PREPROCESSING)
+        logger.info("[STAGE 5/9] Preprocessing | job_id=%s", job_id)
         log_stage(ProcessingStage.PREPROCESSING, {"job_id": job_id})
-        await asyncio.sleep(0.2)
         
         # Stage 6: Upscaling (THE MAIN EVENT)
-        active_jobs[job_id]["stage"] = ProcessingStage.UPSCALING.value
-        logger.info(f"[STAGE 6/9] ⚡ Starting AI upscaling ⚡ | job_id={job_id} | scale={scale}x")
+        await set_stage(job, ProcessingStage.UPSCALING)
+        logger.info("[STAGE 6/9] ⚡ Starting AI upscaling ⚡ | job_id=%s | scale=%sx", job_id, scale)
         log_stage(ProcessingStage.UPSCALING, {"job_id": job_id, "scale": f"{scale}x"})
         
         upscale_start = time.time()
-        logger.info(f"[UPSCALE] Running model.predict() | job_id={job_id}")
+        logger.info("[UPSCALE] Running RRDBNet forward | job_id=%s", job_id)
         
-        sr_image = model.predict(image)
+        # Patches are batched with any concurrent requests at the same scale
+        sr_image = await batcher.upscale(image)
         
         upscale_duration = time.time() - upscale_start
-        logger.info(f"[UPSCALE] ✓ Complete | duration={upscale_duration:.2f}s | job_id={job_id}")
+        logger.info("[UPSCALE] ✓ Complete | duration=%.2fs | job_id=%s", upscale_duration, job_id)
         log_performance(ProcessingStage.UPSCALING, upscale_duration)
-        await asyncio.sleep(0.2)
         
         # Stage 7: Postprocessing
-        active_jobs[job_id]["stage"] = ProcessingStage.POSTPROCESSING.value
-        logger.info(f"[STAGE 7/9] Postprocessing | job_id={job_id}")
+        await set_stage(job, ProcessingStage.POSTPROCESSING)
+        logger.info("[STAGE 7/9] Postprocessing | job_id=%s", job_id)
         log_stage(ProcessingStage.POSTPROCESSING, {"job_id": job_id})
-        await asyncio.sleep(0.2)
         
         # Stage 8: Encoding
-        active_jobs[job_id]["stage"] = ProcessingStage.ENCODING.value
-        logger.info(f"[STAGE 8/9] Encoding to PNG | job_id={job_id}")
+        await set_stage(job, ProcessingStage.ENCODING)
+        logger.info("[STAGE 8/9] Encoding to %s | quality=%s | job_id=%s", output_format.upper(), quality, job_id)
         log_stage(ProcessingStage.ENCODING, {"job_id": job_id})
         
+        media_type, encoders = OUTPUT_FORMATS[output_format]
+        encoder = encoders[quality]
         encode_start = time.time()
-        buffer = io.BytesIO()
-        sr_image.save(buffer, format="PNG")
-        buffer.seek(0)
-        image_base64 = base64.b64encode(buffer.getvalue()).decode("utf-8")
+        image_bytes = await asyncio.get_running_loop().run_in_executor(None, encoder, sr_image)
         encode_duration = time.time() - encode_start
         
-        logger.info(f"[ENCODE] Complete | duration={encode_duration:.2f}s | size={len(image_base64)} chars | job_id={job_id}")
-        await asyncio.sleep(0.2)
+        logger.info("[ENCODE] Complete | duration=%.2fs | size=%s bytes | job_id=%s", encode_duration, len(image_bytes), job_id)
         
         # Stage 9: Complete
-        active_jobs[job_id]["stage"] = ProcessingStage.COMPLETED.value
+        await set_stage(job, ProcessingStage.COMPLETED)
         total_duration = time.time() - start_time
-        active_jobs[job_id]["processing_time"] = f"{total_duration:.2f}s"
+        job.processing_time = f"{total_duration:.2f}s"
         
-        logger.info(f"[STAGE 9/9] ✓✓✓ COMPLETED ✓✓✓ | total={total_duration:.2f}s | job_id={job_id}")
+        logger.info("[STAGE 9/9] ✓✓✓ COMPLETED ✓✓✓ | total=%.2fs | job_id=%s", total_duration, job_id)
         log_performance(ProcessingStage.COMPLETED, total_duration)
         
-        # Keep job alive for a bit so SSE can send completion event
-        await asyncio.sleep(0.5)
-        
-        output_width_final, output_height_final = sr_image.size
-        
-        return JSONResponse({
-            "success": True,
-            "processedImage": f"data:image/png;base64,{image_base64}",
-            "message": "Image successfully upscaled",
-            "job_id": job_id,
-            "metadata": {
-                "input_dimensions": f"{width}x{height}",
-                "output_dimensions": f"{output_width_final}x{output_height_final}",
-                "scale": scale,
-                "processing_time": f"{total_duration:.2f}s",
-                "upscaling_time": f"{upscale_duration:.2f}s",
-                "encoding_time": f"{encode_duration:.2f}s"
+        output_height_final, output_width_final = sr_image.shape[-2:]
+        
+        # Raw image body; metadata travels in headers (no base64/JSON wrapping)
+        return Response(
+            content=image_bytes,
+            media_type=media_type,
+            headers={
+                "X-Job-Id": job_id,
+                "X-Scale": str(scale),
+                "X-Input-Dimensions": f"{width}x{height}",
+                "X-Output-Dimensions": f"{output_width_final}x{output_height_final}",
+                "X-Processing-Time": f"{total_duration:.2f}s",
+                "X-Upscaling-Time": f"{upscale_duration:.2f}s",
+                "X-Encoding-Time": f"{encode_duration:.2f}s"
             }
-        })
+        )
         
-    except HTTPException:
+    except HTTPException as exc:
+        # Close any SSE stream for a rejected request instead of leaving it mid-stage
+        job.error_message = str(exc.detail)
+        await set_stage(job, ProcessingStage.ERROR)
         raise
     except Exception as exc:
-        active_jobs[job_id]["stage"] = ProcessingStage.ERROR.value
-        active_jobs[job_id]["error_message"] = str(exc)
-        logger.error(f"[ERROR] Processing failed | job_id={job_id} | error={exc}", exc_info=True)
+        job.error_message = str(exc)
+        await set_stage(job, ProcessingStage.ERROR)
+        logger.error("[ERROR] Processing failed | job_id=%s | error=%s", job_id, exc, exc_info=True)
         log_error(ProcessingStage.ERROR, exc, {"job_id": job_id})
         raise HTTPException(status_code=500, detail=f"Processing failed: {str(exc)}") from exc
+    finally:
+        finish_job(job_id, job)
 
 
 @app.get("/progress/{job_id}")
 async def get_progress(job_id: str):
     """
     Stream progress updates via Server-Sent Events
-    Waits for job creation to handle race conditions
+    Waits (without polling) for the job to be created to handle race conditions
     """
-    logger.info(f"[PROGRESS] Client connected | job_id={job_id}")
+    logger.info("[PROGRESS] Client connected | job_id=%s", job_id)
     
-    # Wait up to 5 seconds for job to be created
-    max_wait = 5
-    wait_interval = 0.1
-    waited = 0
+    # The SSE client usually connects before /upscale registers the job:
+    # leave a placeholder and sleep until the upload claims it
+    job = reserve_job(job_id) if JOB_ID_PATTERN.fullmatch(job_id) else None
     
-    while job_id not in active_jobs and waited < max_wait:
-        await asyncio.sleep(wait_interval)
-        waited += wait_interval
+    if job is not None and not job.claimed:
+        try:
+            async with job.cond:
+                await asyncio.wait_for(job.cond.wait_for(lambda: job.claimed), JOB_WAIT_SECONDS)
+        except asyncio.TimeoutError:
+            expire_job(job_id, job)
     
-    if job_id not in active_jobs:
-        logger.warning(f"[PROGRESS] Job not found after {max_wait}s | job_id={job_id}")
+    if job is None or not job.claimed:
+        logger.warning("[PROGRESS] Job not found after %ss | job_id=%s", JOB_WAIT_SECONDS, job_id)
         
         async def error_generator():
             yield format_sse_message({
@@ -334,7 +653,7 @@ async def get_progress(job_id: str):
             media_type="text/event-stream"
         )
     
-    logger.info(f"[PROGRESS] Job found, starting stream | job_id={job_id}")
+    logger.info("[PROGRESS] Job found, starting stream | job_id=%s", job_id)
     return StreamingResponse(
         progress_generator(job_id),
         media_type="text/event-stream",
@@ -349,29 +668,19 @@ async def get_progress(job_id: str):
 @app.get("/scales")
 async def get_scales():
     """Get available scaling factors"""
-    return JSONResponse({
-        "scales": list(SCALE_CONFIGS.keys()),
-        "default": 4,
-        "loaded": list(models.keys())
-    })
+    return Response(SCALES_JSON_BYTES, media_type="application/json")
 
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return JSONResponse({
-        "status": "healthy",
-        "modelLoaded": len(models) > 0,
-        "device": str(device),
-        "loaded_scales": list(models.keys()),
-        "supported_scales": list(SCALE_CONFIGS.keys())
-    })
+    return Response(HEALTH_JSON_BYTES, media_type="application/json")
 
 
 @app.get("/")
 async def root():
     """Root endpoint"""
-    return JSONResponse({
+    return ORJSONResponse({
         "service": "ESRGAN Interface API",
         "version": "2.0.0",
         "endpoints": {
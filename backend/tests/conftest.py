@@ -0,0 +1,58 @@
+# backend/tests/conftest.py
+# ============================
+# Shared session fixtures
+# ============================
+
+from io import BytesIO
+
+import pytest
+import torch
+from fastapi.testclient import TestClient
+from PIL import Image
+from py_real_esrgan.model import RealESRGAN
+
+from app.main import app
+
+
+@pytest.fixture(scope="session")
+def client() -> TestClient:
+    """
+    One TestClient for the whole session.
+
+    The app's models live in module-level caches, so every test file
+    reuses whatever an earlier request already loaded.
+    """
+    return TestClient(app)
+
+
+@pytest.fixture(scope="session")
+def dummy_png() -> bytes:
+    """A 16x16 solid-colour PNG, encoded once"""
+    img = Image.new("RGB", (16, 16), color=(10, 20, 30))
+    buffer = BytesIO()
+    img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture(scope="session")
+def esrgan_model() -> RealESRGAN:
+    """
+    Session scoped fixture that loads the RealESRGAN model once.
+
+    This keeps tests fast by avoiding repeated weight loading.
+    Uses GPU if available for actual performance testing.
+    """
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    scale = 4
+
+    # Report device being used
+    if device.type == "cuda":
+        print(f"\n[ESRGAN] Using GPU: {torch.cuda.get_device_name(0)}")
+    else:
+        print("\n[ESRGAN] Using CPU")
+
+    model = RealESRGAN(device, scale=scale)
+    model.load_weights("weights/RealESRGAN_x4.pth", download=True)
+    model.model.eval()
+
+    return model
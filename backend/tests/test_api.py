@@ -3,45 +3,101 @@
 # FastAPI endpoint tests
 # ============================
 
+import asyncio
 from io import BytesIO
+from tempfile import SpooledTemporaryFile
 
+from fastapi import UploadFile
 from fastapi.testclient import TestClient
 from PIL import Image
 
+from app import main
 from app.main import app
 
 
-client = TestClient(app)
+def test_upscale_endpoint_returns_png(client, dummy_png):
+    """
+    Sending a valid PNG should return raw PNG bytes with metadata headers.
+    """
+    files = {"file": ("test.png", dummy_png, "image/png")}
+    data = {"scale": "4"}
+    response = client.post("/upscale", files=files, data=data)
 
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/png"
+    assert response.content.startswith(b"\x89PNG\r\n\x1a\n")
 
-def _create_dummy_png(width: int = 16, height: int = 16) -> bytes:
-    img = Image.new("RGB", (width, height), color=(10, 20, 30))
-    buffer = BytesIO()
-    img.save(buffer, format="PNG")
-    return buffer.getvalue()
+    result = Image.open(BytesIO(response.content))
+    assert result.size == (64, 64)
+    assert response.headers["X-Scale"] == "4"
+    assert response.headers["X-Output-Dimensions"] == "64x64"
 
 
-def test_upscale_endpoint_returns_png():
+def test_upscale_endpoint_returns_webp(client, dummy_png):
     """
-    Sending a valid PNG should return a JSON response with base64 image.
+    ?format=webp should return WebP bytes of the upscaled size.
     """
-    img_bytes = _create_dummy_png()
+    files = {"file": ("test.png", dummy_png, "image/png")}
+    response = client.post("/upscale?format=webp", files=files, data={"scale": "2"})
 
-    files = {"file": ("test.png", img_bytes, "image/png")}
-    data = {"scale": "4"}
-    response = client.post("/upscale", files=files, data=data)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/webp"
+
+    result = Image.open(BytesIO(response.content))
+    assert result.format == "WEBP"
+    assert result.size == (32, 32)
+
+
+def test_upscale_endpoint_returns_small_jpeg(client, dummy_png):
+    """
+    ?format=jpeg&quality=small should return JPEG bytes of the upscaled size.
+    """
+    files = {"file": ("test.png", dummy_png, "image/png")}
+    response = client.post("/upscale?format=jpeg&quality=small", files=files, data={"scale": "2"})
 
     assert response.status_code == 200
-    result = response.json()
-    
-    assert result["success"] is True
-    assert "processedImage" in result
-    assert result["processedImage"].startswith("data:image/png;base64,")
-    assert "metadata" in result
-    assert result["metadata"]["scale"] == 4
+    assert response.headers["content-type"] == "image/jpeg"
 
+    result = Image.open(BytesIO(response.content))
+    assert result.format == "JPEG"
+    assert result.size == (32, 32)
 
-def test_upscale_endpoint_rejects_non_image():
+
+def test_upscale_endpoint_rejects_unknown_format(client, dummy_png):
+    """
+    Unknown output formats should be rejected with a 400 error.
+    """
+    files = {"file": ("test.png", dummy_png, "image/png")}
+    response = client.post("/upscale?format=bmp", files=files)
+
+    assert response.status_code == 400
+    assert "Unsupported format" in response.json()["detail"]
+
+    files = {"file": ("test.png", dummy_png, "image/png")}
+    response = client.post("/upscale?quality=max", files=files)
+
+    assert response.status_code == 400
+    assert "Unsupported quality" in response.json()["detail"]
+
+
+def test_upscale_endpoint_rejects_unsupported_scale(client, dummy_png):
+    """
+    Scales without a model should be rejected with a 400 error; non-integer
+    scales fail form validation.
+    """
+    files = {"file": ("test.png", dummy_png, "image/png")}
+    response = client.post("/upscale", files=files, data={"scale": "3"})
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Unsupported scale: 3x. Supported: [2, 4]"
+
+    files = {"file": ("test.png", dummy_png, "image/png")}
+    response = client.post("/upscale", files=files, data={"scale": "four"})
+
+    assert response.status_code == 422
+
+
+def test_upscale_endpoint_rejects_non_image(client):
     """
     Non image payloads should be rejected with a 400 error.
     """
@@ -51,3 +107,120 @@ def test_upscale_endpoint_rejects_non_image():
     assert response.status_code == 400
     result = response.json()
     assert "Unsupported file type" in result["detail"]
+
+
+def test_upscale_endpoint_rejects_mislabeled_upload(client):
+    """
+    A non-image body sent as image/png should be rejected by its signature.
+    """
+    files = {"file": ("test.png", b"definitely not a png", "image/png")}
+    response = client.post("/upscale", files=files)
+
+    assert response.status_code == 400
+    assert "not a PNG, JPEG or WebP" in response.json()["detail"]
+
+
+def test_upscale_endpoint_rejects_oversized_upload(client, dummy_png, monkeypatch):
+    """
+    Uploads over MAX_UPLOAD_BYTES should be rejected with 413 before decoding.
+    """
+    monkeypatch.setattr(main, "MAX_UPLOAD_BYTES", len(dummy_png) - 1)
+
+    files = {"file": ("test.png", dummy_png, "image/png")}
+    response = client.post("/upscale", files=files)
+
+    assert response.status_code == 413
+    assert "File too large" in response.json()["detail"]
+
+
+def test_read_upload_with_known_size(dummy_png):
+    """
+    Multipart uploads arrive as a SpooledTemporaryFile with size set; reading
+    one must work on every supported Python (no readinto before 3.11).
+    """
+    spooled = SpooledTemporaryFile()
+    spooled.write(dummy_png)
+
+    upload = UploadFile(spooled, size=len(dummy_png), filename="test.png")
+    contents = asyncio.run(main.read_upload(upload))
+
+    assert isinstance(contents, bytearray)
+    assert contents == dummy_png
+
+
+def test_upscale_endpoint_rejects_invalid_job_id(client, dummy_png):
+    """
+    Job ids that cannot travel in a response header should be rejected up front.
+    """
+    files = {"file": ("test.png", dummy_png, "image/png")}
+    response = client.post("/upscale", files=files, data={"job_id": "job\u2603"})
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid job_id"
+    assert "job\u2603" not in main.active_jobs
+
+
+def test_startup_preloads_all_scales():
+    """
+    Entering the app lifespan should load a model and batcher for every configured
+    scale, and the cached /health body should list them.
+    """
+    with TestClient(app) as client:
+        assert set(main.models) == set(main.SCALE_CONFIGS)
+        assert set(main.batchers) == set(main.SCALE_CONFIGS)
+        assert set(client.get("/health").json()["loaded_scales"]) == set(main.SCALE_CONFIGS)
+
+
+def test_concurrent_first_requests_share_one_model_load(monkeypatch):
+    """
+    Two requests hitting a cold scale at once should trigger a single load.
+    """
+    monkeypatch.setattr(main, "models", {})
+    monkeypatch.setattr(main, "batchers", {})
+
+    loads = []
+    get_or_create_model = main.get_or_create_model
+
+    def counting_load(scale):
+        loads.append(scale)
+        return get_or_create_model(scale)
+
+    monkeypatch.setattr(main, "get_or_create_model", counting_load)
+
+    async def run():
+        return await asyncio.gather(main.load_batcher(2), main.load_batcher(2))
+
+    first, second = asyncio.run(run())
+
+    assert first is second
+    assert loads == [2]
+
+
+def test_cancelled_upscale_closes_progress_stream(dummy_png, monkeypatch):
+    """
+    Cancelling /upscale mid-request (e.g. client disconnect) should end its SSE stream.
+    """
+    async def never_loads(scale):
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(main, "load_batcher", never_loads)
+
+    async def run():
+        upload = UploadFile(BytesIO(dummy_png), size=len(dummy_png), filename="test.png",
+                            headers={"content-type": "image/png"})
+        handler = asyncio.ensure_future(main.upscale_image(
+            file=upload, scale=4, job_id="test-job-cancel", output_format="png", quality="fast"
+        ))
+        while main.active_jobs.get("test-job-cancel") is None or \
+                main.active_jobs["test-job-cancel"].stage != main.ProcessingStage.PREPARING_MODEL:
+            await asyncio.sleep(0.01)
+
+        stream = main.progress_generator("test-job-cancel")
+        await stream.__anext__()
+        handler.cancel()
+        return [frame async for frame in stream]
+
+    frames = asyncio.run(asyncio.wait_for(run(), timeout=5))
+    assert b'"stage":"error"' in frames[0]
+    main.active_jobs.pop("test-job-cancel", None)
+
@@ -3,36 +3,21 @@
 # RealESRGAN model smoke tests
 # ============================
 
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
 from pathlib import Path
 
+import numpy as np
 import pytest
 import torch
+import torch.nn.functional as F
 from PIL import Image
 from py_real_esrgan.model import RealESRGAN
 
-
-@pytest.fixture(scope="session")
-def esrgan_model() -> RealESRGAN:
-    """
-    Session scoped fixture that loads the RealESRGAN model once.
-
-    This keeps tests fast by avoiding repeated weight loading.
-    Uses GPU if available for actual performance testing.
-    """
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    scale = 4
-
-    # Report device being used
-    if device.type == "cuda":
-        print(f"\n[ESRGAN] Using GPU: {torch.cuda.get_device_name(0)}")
-    else:
-        print("\n[ESRGAN] Using CPU")
-
-    model = RealESRGAN(device, scale=scale)
-    model.load_weights("weights/RealESRGAN_x4.pth", download=True)
-    model.model.eval()
-
-    return model
+from app import batching
+from app.batching import PatchBatcher
+from app.inference import decode_image_tensor, prepare_cuda_model, upscale_tensor
 
 
 def test_model_upscales_size(esrgan_model: RealESRGAN):
@@ -58,6 +43,105 @@ def test_model_upscales_size(esrgan_model: RealESRGAN):
         assert model_device.type == "cuda", "GPU available but model not using it"
 
 
+def test_upscale_tensor_matches_predict(esrgan_model: RealESRGAN):
+    """
+    The tensor path (decode -> RRDBNet forward -> uint8) should reproduce
+    RealESRGAN.predict up to rounding, including patch stitching on a
+    non-square image that spans several patches.
+    """
+    w, h = 210, 40
+    rng = np.random.default_rng(0)
+    img = Image.fromarray(rng.integers(0, 256, (h, w, 3), dtype=np.uint8))
+    buffer = BytesIO()
+    img.save(buffer, format="PNG")
+
+    expected = np.asarray(esrgan_model.predict(img), dtype=np.int16)
+    out = upscale_tensor(esrgan_model, decode_image_tensor(buffer.getvalue()))
+
+    assert out.dtype == torch.uint8
+    assert tuple(out.shape) == (3, h * 4, w * 4)
+    actual = out.permute(1, 2, 0).numpy().astype(np.int16)
+    assert np.abs(actual - expected).max() <= 1
+
+
+def test_patch_batcher_shares_forward_across_requests(esrgan_model: RealESRGAN, monkeypatch):
+    """
+    Two concurrent single-patch images should run as one forward pass and
+    still match upscaling each image on its own.
+    """
+    batch_sizes = []
+    forward_batch = batching._forward_batch
+
+    def counting_forward(model, slices, scale):
+        batch_sizes.append(sum(piece.shape[0] for piece in slices))
+        return forward_batch(model, slices, scale)
+
+    monkeypatch.setattr(batching, "_forward_batch", counting_forward)
+
+    rng = np.random.default_rng(2)
+    images = [
+        torch.from_numpy(rng.integers(0, 256, (3, h, w), dtype=np.uint8))
+        for w, h in ((32, 24), (20, 40))
+    ]
+
+    async def run():
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            batcher = PatchBatcher(esrgan_model, executor)
+            return await asyncio.gather(*(batcher.upscale(image) for image in images))
+
+    outputs = asyncio.run(run())
+
+    assert batch_sizes == [2]
+    for image, out in zip(images, outputs):
+        assert torch.equal(out, upscale_tensor(esrgan_model, image))
+
+
+def test_upscale_tensor_downscales_to_smaller_scale(esrgan_model: RealESRGAN):
+    """
+    Serving 2x from the 4x model resizes each patch before its overlap is
+    cropped, so the stitched result should match resizing the full 4x
+    output, seam included (two patches side by side).
+    """
+    w, h = 200, 20
+    rng = np.random.default_rng(3)
+    image = torch.from_numpy(rng.integers(0, 256, (3, h, w), dtype=np.uint8))
+
+    full = upscale_tensor(esrgan_model, image).float().unsqueeze(0)
+    expected = F.interpolate(full, scale_factor=0.5, mode="bicubic", antialias=True)
+    expected = expected.clamp(0, 255).round().squeeze(0).to(torch.int16)
+    out = upscale_tensor(esrgan_model, image, scale=2)
+
+    assert tuple(out.shape) == (3, h * 2, w * 2)
+    diff = (out.to(torch.int16) - expected).abs()
+    # Interior pixels only: the full-image resize clamps at the outer border
+    assert diff[:, 4:-4, 4:-4].max() <= 2
+
+
+@pytest.mark.skipif(not torch.cuda.is_available(), reason="FP16 path is CUDA only")
+def test_upscale_tensor_fp16_close_to_fp32(esrgan_model: RealESRGAN):
+    """
+    The app runs the CUDA model in FP16 and channels_last. Its output should
+    stay close to FP32, including a final partial batch (6 patches with
+    BATCH_SIZE 4).
+    """
+    w, h = 400, 200
+    rng = np.random.default_rng(1)
+    image = torch.from_numpy(rng.integers(0, 256, (3, h, w), dtype=np.uint8))
+
+    half_model = RealESRGAN(esrgan_model.device, scale=4)
+    half_model.model.load_state_dict(esrgan_model.model.state_dict())
+    half_model.model.eval()
+    prepare_cuda_model(half_model)
+
+    expected = upscale_tensor(esrgan_model, image).to(torch.int16)
+    out = upscale_tensor(half_model, image).to(torch.int16)
+
+    diff = (out - expected).abs()
+    assert tuple(out.shape) == (3, h * 4, w * 4)
+    assert diff.float().mean() < 1.0
+    assert diff.max() <= 16
+
+
 @pytest.mark.slow
 def test_model_inference_runs_and_saves_output(esrgan_model: RealESRGAN, tmp_path: Path):
     """
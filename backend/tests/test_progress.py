@@ -3,26 +3,34 @@
 # Simplified version with comprehensive logging
 # ============================================================
 
+import asyncio
 import pytest
 import json
-from fastapi.testclient import TestClient
 from PIL import Image
 import io
 
-from app.main import app, active_jobs
-from app.logging_utils import ProcessingStage
+from app.main import (
+    active_jobs,
+    create_job,
+    expire_job,
+    finish_job,
+    get_progress,
+    new_job_id,
+    progress_generator,
+    set_stage,
+)
+from app.logging_utils import (
+    STAGE_FRAME_BUILDERS,
+    ProcessingStage,
+    create_progress_event,
+    encode_sse_fields,
+)
 
 
 # ============================================================
 # Test Client Setup
 # ============================================================
 
-@pytest.fixture
-def client():
-    """Create test client"""
-    return TestClient(app)
-
-
 @pytest.fixture
 def sample_image():
     """Create a small test image"""
@@ -49,10 +57,8 @@ def test_progress_basic(client):
     print("\n[TEST] test_progress_basic")
     job_id = "test-job-1"
     
-    active_jobs[job_id] = {
-        "stage": ProcessingStage.COMPLETED.value,
-        "scale": 4
-    }
+    job = create_job(job_id, 4)
+    job.stage = ProcessingStage.COMPLETED
     print(f"[TEST] Created job: {job_id}")
     
     with client.stream("GET", f"/progress/{job_id}") as response:
@@ -91,6 +97,149 @@ def test_progress_nonexistent_job(client):
                     break
 
 
+def test_progress_generator_wakes_on_stage_change():
+    """Test stage changes are pushed to the stream without polling"""
+    print("\n[TEST] test_progress_generator_wakes_on_stage_change")
+    job_id = "test-job-push"
+    
+    async def run():
+        job = create_job(job_id, 4)
+        stream = progress_generator(job_id)
+        
+        first = await asyncio.wait_for(stream.__anext__(), timeout=1)
+        pending = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0)
+        assert not pending.done()
+        
+        await set_stage(job, ProcessingStage.COMPLETED)
+        second = await asyncio.wait_for(pending, timeout=1)
+        return [first, second]
+    
+    frames = asyncio.run(run())
+    stages = [json.loads(frame[6:])["stage"] for frame in frames]
+    print(f"[TEST] Stages: {stages}")
+    assert stages == [ProcessingStage.INITIALIZING.value, ProcessingStage.COMPLETED.value]
+
+
+def test_progress_waits_for_job_registration():
+    """Test an SSE client that connects before /upscale is woken by the job's registration"""
+    print("\n[TEST] test_progress_waits_for_job_registration")
+    job_id = "test-job-early"
+    
+    async def run():
+        pending = asyncio.ensure_future(get_progress(job_id))
+        await asyncio.sleep(0)
+        assert not pending.done()
+        
+        job = create_job(job_id, 4)
+        await set_stage(job, ProcessingStage.VALIDATING)
+        response = await asyncio.wait_for(pending, timeout=1)
+        
+        assert active_jobs[job_id] is job
+        return await asyncio.wait_for(response.body_iterator.__anext__(), timeout=1)
+    
+    frame = json.loads(asyncio.run(run())[6:])
+    print(f"[TEST] Event: {frame}")
+    assert frame["stage"] == ProcessingStage.VALIDATING.value
+    assert frame["scale"] == 4
+
+
+def test_sse_frame_matches_progress_event():
+    """Test cached stage frames carry the same payload as create_progress_event"""
+    print("\n[TEST] test_sse_frame_matches_progress_event")
+    info = {
+        "job_id": "test-job-frame",
+        "scale": 4,
+        "input_dimensions": "32x32",
+        "output_dimensions": None,
+    }
+    
+    for stage in ProcessingStage:
+        frame = json.loads(STAGE_FRAME_BUILDERS[stage.idx](encode_sse_fields(info))[6:])
+        event = create_progress_event(stage, info)
+        assert isinstance(frame.pop("ts"), float)
+        assert isinstance(event.pop("ts"), float)
+        assert frame == event
+
+
+def test_expire_job_removes_finished_job():
+    """Test expiry drops the job but keeps a newer job that reused its id"""
+    print("\n[TEST] test_expire_job_removes_finished_job")
+    
+    old_job = create_job("test-job-expire", 4)
+    expire_job("test-job-expire", old_job)
+    assert "test-job-expire" not in active_jobs
+    
+    old_job = create_job("test-job-reused", 4)
+    new_job = create_job("test-job-reused", 2)
+    expire_job("test-job-reused", old_job)
+    assert active_jobs["test-job-reused"] is new_job
+
+
+def test_set_stage_only_updates_its_own_job():
+    """Test a request whose job_id was reused keeps publishing to its own job"""
+    print("\n[TEST] test_set_stage_only_updates_its_own_job")
+    
+    async def run():
+        first = create_job("test-job-dup", 4)
+        second = create_job("test-job-dup", 2)
+        await set_stage(first, ProcessingStage.COMPLETED)
+        return first, second
+    
+    first, second = asyncio.run(run())
+    assert first.stage == ProcessingStage.COMPLETED
+    assert second.stage == ProcessingStage.INITIALIZING
+    assert active_jobs["test-job-dup"] is second
+
+
+def test_finish_job_closes_streams_of_aborted_job():
+    """Test a handler that exits mid-stage (e.g. cancelled) still ends its SSE streams"""
+    print("\n[TEST] test_finish_job_closes_streams_of_aborted_job")
+    job_id = "test-job-aborted"
+    
+    async def run():
+        job = create_job(job_id, 4)
+        stream = progress_generator(job_id)
+        frames = [await asyncio.wait_for(stream.__anext__(), timeout=1)]
+        
+        finish_job(job_id, job)
+        async for frame in stream:
+            frames.append(frame)
+        return frames
+    
+    frames = asyncio.run(asyncio.wait_for(run(), timeout=2))
+    events = [json.loads(frame[6:]) for frame in frames]
+    print(f"[TEST] Events: {events}")
+    assert [event.get("stage") for event in events[:2]] == ["initializing", "error"]
+    assert events[-1]["error"] == "Request aborted"
+
+
+def test_new_job_id_is_unique_and_ordered():
+    """Test generated job ids are distinct and sort in creation order"""
+    print("\n[TEST] test_new_job_id_is_unique_and_ordered")
+    ids = [new_job_id() for _ in range(1000)]
+    
+    assert len(set(ids)) == len(ids)
+    assert ids == sorted(ids)
+
+
+def test_progress_reports_rejected_upload(client):
+    """Test a rejected upload ends its progress stream with the error"""
+    print("\n[TEST] test_progress_reports_rejected_upload")
+    job_id = "test-job-rejected"
+    
+    files = {"file": ("test.txt", b"not an image", "text/plain")}
+    response = client.post("/upscale", files=files, data={"job_id": job_id})
+    assert response.status_code == 400
+    
+    with client.stream("GET", f"/progress/{job_id}") as response:
+        events = [json.loads(line[6:]) for line in response.iter_lines() if line.startswith("data:")]
+    
+    print(f"[TEST] Events: {events}")
+    assert events[0]["stage"] == ProcessingStage.ERROR.value
+    assert "Unsupported file type" in events[-1]["error"]
+
+
 # ============================================================
 # Integration Tests
 # ============================================================
@@ -107,12 +256,8 @@ def test_upscale_endpoint(client, sample_image):
     
     print(f"[TEST] Response status: {response.status_code}")
     assert response.status_code == 200
-    
-    result = response.json()
-    print(f"[TEST] Success: {result.get('success')}")
-    assert result["success"] is True
-    assert "metadata" in result
-    print(f"[TEST] Metadata: {result['metadata']}")
+    assert response.headers["content-type"] == "image/png"
+    print(f"[TEST] Processing time: {response.headers['X-Processing-Time']}")
 
 
 def test_upscale_with_2x_scale(client, sample_image):
@@ -129,9 +274,8 @@ def test_upscale_with_2x_scale(client, sample_image):
     print(f"[TEST] Response status: {response.status_code}")
     assert response.status_code == 200
     
-    result = response.json()
-    print(f"[TEST] Scale: {result['metadata']['scale']}")
-    assert result["metadata"]["scale"] == 2
+    print(f"[TEST] Scale: {response.headers['X-Scale']}")
+    assert response.headers["X-Scale"] == "2"
 
 
 def test_upscale_with_4x_scale(client, sample_image):
@@ -148,9 +292,8 @@ def test_upscale_with_4x_scale(client, sample_image):
     print(f"[TEST] Response status: {response.status_code}")
     assert response.status_code == 200
     
-    result = response.json()
-    print(f"[TEST] Scale: {result['metadata']['scale']}")
-    assert result["metadata"]["scale"] == 4
+    print(f"[TEST] Scale: {response.headers['X-Scale']}")
+    assert response.headers["X-Scale"] == "4"
 
 
 # ============================================================
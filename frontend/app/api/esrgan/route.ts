@@ -18,12 +18,33 @@ export async function POST(request: NextRequest) {
     // Get the form data from the client request
     const formData = await request.formData();
 
+    // Pass output options (e.g. ?format=webp) through to the backend
+    const options = new URLSearchParams(searchParams);
+    options.delete("endpoint");
+    const query = options.toString();
+
     // Forward the request to the backend
-    const response = await fetch(`${BACKEND_URL}/${endpoint}`, {
+    const response = await fetch(`${BACKEND_URL}/${endpoint}${query ? `?${query}` : ""}`, {
       method: "POST",
       body: formData,
     });
 
+    // Upscaled images come back as raw bytes with metadata in X-* headers
+    const contentType = response.headers.get("content-type") || "";
+    if (response.ok && contentType.startsWith("image/")) {
+      const headers = new Headers({ "content-type": contentType });
+      response.headers.forEach((value, key) => {
+        if (key.startsWith("x-")) {
+          headers.set(key, value);
+        }
+      });
+
+      return new NextResponse(response.body, {
+        status: response.status,
+        headers,
+      });
+    }
+
     // Get the response data
     const data = await response.json();
 
@@ -55,6 +55,18 @@ export default function Home() {
     }
   }, [selectedFile]);
 
+  // ============================================================
+  // Effect: Release Processed Image URL
+  // ============================================================
+
+  useEffect(() => {
+    if (processedImage) {
+      return () => {
+        revokePreviewUrl(processedImage);
+      };
+    }
+  }, [processedImage]);
+
   // ============================================================
   // Effect: Cleanup Progress Connection
   // ============================================================
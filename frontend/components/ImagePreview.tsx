@@ -7,7 +7,7 @@
 import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card";
 import { Button } from "@/components/ui/button";
 import { ImagePreviewProps } from "@/types/props";
-import { downloadBase64Image } from "@/lib/utils";
+import { downloadImage } from "@/lib/utils";
 
 export function ImagePreview({
   originalImage,
@@ -20,7 +20,7 @@ export function ImagePreview({
 
   const handleDownload = () => {
     if (processedImage) {
-      downloadBase64Image(processedImage, "upscaled-image.png");
+      downloadImage(processedImage, "upscaled-image.png");
     }
   };
 
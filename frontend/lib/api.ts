@@ -55,7 +55,24 @@ export async function upscaleImage(
     );
   }
 
-  return response.json();
+  // Body is the raw upscaled image; metadata is carried in response headers
+  const image = await response.blob();
+  const headers = response.headers;
+
+  return {
+    success: true,
+    processedImage: URL.createObjectURL(image),
+    message: "Image successfully upscaled",
+    job_id: headers.get("X-Job-Id") || jobId || "",
+    metadata: {
+      input_dimensions: headers.get("X-Input-Dimensions") || "",
+      output_dimensions: headers.get("X-Output-Dimensions") || "",
+      scale: Number(headers.get("X-Scale") || scale),
+      processing_time: headers.get("X-Processing-Time") || "",
+      upscaling_time: headers.get("X-Upscaling-Time") || "",
+      encoding_time: headers.get("X-Encoding-Time") || "",
+    },
+  };
 }
 
 /**
@@ -37,14 +37,14 @@ export function revokePreviewUrl(url: string): void {
 }
 
 /**
- * Download a base64 image
+ * Download an image from an object URL or data URL
  */
-export function downloadBase64Image(
-  base64Data: string,
+export function downloadImage(
+  imageUrl: string,
   filename: string = "upscaled-image.png"
 ): void {
   const link = document.createElement("a");
-  link.href = base64Data;
+  link.href = imageUrl;
   link.download = filename;
   document.body.appendChild(link);
   link.click();
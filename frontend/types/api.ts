@@ -35,7 +35,7 @@ export interface ProgressEvent {
   stage: ProcessingStage;
   description: string;
   progress: number;
-  timestamp: string;
+  ts: number;
   job_id?: string;
   scale?: number;
   input_dimensions?: string;